@@ -8,7 +8,14 @@ import paho.mqtt.client as mqtt
 import json
 import time
 import math
+import random
+import socket
 from datetime import datetime
+from itertools import accumulate
+
+# Bound once so generate_vitals skips the module attribute lookups
+_randint = random.randint
+_uniform = random.uniform
 
 # MQTT Configuration
 BROKER = "broker.hivemq.com"
@@ -16,6 +23,7 @@ PORT = 1883
 TOPIC_LOCATION = "ambulance/amb-42/location"
 TOPIC_ETA = "rescue/eta"
 TOPIC_VITALS = "patient/P-8492/vitals"
+MQTT_QOS = 0  # Fire-and-forget: a fresher update follows every tick
 
 # Bhopal Coordinates
 # Hospital: AIIMS Bhopal (23.2156, 77.4304)
@@ -39,73 +47,126 @@ ROUTE_WAYPOINTS = [
     {"lat": 23.2156, "lon": 77.4304, "location": "AIIMS Bhopal (Hospital)"},
 ]
 
+# Waypoint coordinates as columns for whole-route distance calculations
+WAYPOINT_LATS = tuple(wp["lat"] for wp in ROUTE_WAYPOINTS)
+WAYPOINT_LONS = tuple(wp["lon"] for wp in ROUTE_WAYPOINTS)
+WAYPOINT_NAMES = tuple(wp["location"] for wp in ROUTE_WAYPOINTS)
+
+# Waypoints never change, so convert them to radians (and cos(lat)) once
+WAYPOINT_LATS_RAD = tuple(map(math.radians, WAYPOINT_LATS))
+WAYPOINT_LONS_RAD = tuple(map(math.radians, WAYPOINT_LONS))
+WAYPOINT_COS_LATS = tuple(map(math.cos, WAYPOINT_LATS_RAD))
+
 # Simulation parameters
 SPEED_KMH = 50  # Average ambulance speed in km/h
 UPDATE_INTERVAL = 2  # Send updates every 2 seconds
 POINTS_PER_SEGMENT = 20  # Number of interpolation points between waypoints
 
+# Compass headings (degrees) indexed by (sign(dlat) + 1) * 3 + (sign(dlon) + 1)
+COMPASS_HEADINGS = (225, 180, 135, 270, 0, 90, 315, 0, 45)
+TAN_22_5 = 0.41421356  # Travel within 22.5° of an axis snaps to that axis
+
+# Telemetry is machine-read, so payloads use compact JSON with no whitespace
+JSON_SEPARATORS = (",", ":")
+
+# Location payload with the static fields serialized once; only the
+# coordinates, heading, status and timestamp are filled in per tick
+LOCATION_PAYLOAD_TEMPLATE = (
+    '{"lat":%%r,"lon":%%r,"speed_kmh":%s,"heading":%%d,'
+    '"status":"%%s","location_name":%%s,"timestamp":"%%s"}' % json.dumps(SPEED_KMH)
+)
+
+# ETA payload with the constant speed pre-serialized
+ETA_PAYLOAD_TEMPLATE = (
+    '{"eta_minutes":%%d,"eta_seconds":%%d,"remaining_km":%%r,'
+    '"distance":"%%.2f","eta":"%%d","speed":%s,"arrival":"%%s",'
+    '"status":"%%s","timestamp":"%%s"}' % json.dumps(str(SPEED_KMH))
+)
+
+# JSON-escaped waypoint names, indexed by route segment
+WAYPOINT_NAMES_JSON = tuple(map(json.dumps, WAYPOINT_NAMES))
+
 # Calculate total distance
-def haversine_distance(lat1, lon1, lat2, lon2):
-    """Calculate distance between two points in kilometers using Haversine formula"""
+def haversine_rad(lat1_rad, lon1_rad, cos_lat1, lat2_rad, lon2_rad, cos_lat2):
+    """Calculate Haversine distance in km from radians and precomputed cos(lat)"""
     R = 6371  # Earth's radius in kilometers
     
-    dlat = math.radians(lat2 - lat1)
-    dlon = math.radians(lon2 - lon1)
-    
-    a = (math.sin(dlat/2) ** 2 + 
-         math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * 
-         math.sin(dlon/2) ** 2)
+    a = (math.sin((lat2_rad - lat1_rad) / 2) ** 2 +
+         cos_lat1 * cos_lat2 * math.sin((lon2_rad - lon1_rad) / 2) ** 2)
     
-    c = 2 * math.asin(math.sqrt(a))
-    distance = R * c
-    
-    return distance
+    return R * 2 * math.asin(min(1.0, math.sqrt(a)))
 
 def interpolate_points(start_lat, start_lon, end_lat, end_lon, num_points):
     """Generate intermediate points between two coordinates"""
-    points = []
-    for i in range(num_points + 1):
-        t = i / num_points
-        lat = start_lat + (end_lat - start_lat) * t
-        lon = start_lon + (end_lon - start_lon) * t
-        points.append((lat, lon))
-    return points
+    dlat = end_lat - start_lat
+    dlon = end_lon - start_lon
+    return [
+        (start_lat + dlat * (i / num_points), start_lon + dlon * (i / num_points))
+        for i in range(num_points + 1)
+    ]
+
+def compass_heading(lat_diff, lon_diff):
+    """Snap a direction of travel to one of 8 compass headings without trig"""
+    abs_lat = abs(lat_diff)
+    abs_lon = abs(lon_diff)
+    
+    # Drop the minor axis when the travel is close to a cardinal direction
+    if abs_lon < abs_lat * TAN_22_5:
+        lon_diff = 0
+    elif abs_lat < abs_lon * TAN_22_5:
+        lat_diff = 0
+    
+    sign_lat = (lat_diff > 0) - (lat_diff < 0)
+    sign_lon = (lon_diff > 0) - (lon_diff < 0)
+    return COMPASS_HEADINGS[(sign_lat + 1) * 3 + (sign_lon + 1)]
 
 def calculate_total_distance():
     """Calculate total route distance"""
-    total = 0
-    for i in range(len(ROUTE_WAYPOINTS) - 1):
-        dist = haversine_distance(
-            ROUTE_WAYPOINTS[i]["lat"], ROUTE_WAYPOINTS[i]["lon"],
-            ROUTE_WAYPOINTS[i + 1]["lat"], ROUTE_WAYPOINTS[i + 1]["lon"]
-        )
-        total += dist
-    return total
+    # Summed from the same segment lengths as the per-point distances, so the
+    # total and the remaining distance always agree
+    return sum(calculate_segment_lengths())
 
-def generate_route_points():
-    """Generate all interpolated points for the entire route"""
-    all_points = []
-    
+def iter_route_points():
+    """Yield (lat, lon, segment) for every interpolated point along the route"""
     for i in range(len(ROUTE_WAYPOINTS) - 1):
-        start = ROUTE_WAYPOINTS[i]
-        end = ROUTE_WAYPOINTS[i + 1]
-        
         points = interpolate_points(
-            start["lat"], start["lon"],
-            end["lat"], end["lon"],
+            WAYPOINT_LATS[i], WAYPOINT_LONS[i],
+            WAYPOINT_LATS[i + 1], WAYPOINT_LONS[i + 1],
             POINTS_PER_SEGMENT
         )
-        
-        # Add points with location info
         for lat, lon in points:
-            all_points.append({
-                "lat": lat,
-                "lon": lon,
-                "segment": i,
-                "location": start["location"]
-            })
+            yield lat, lon, i
+
+def calculate_segment_headings():
+    """Calculate the compass heading of each straight route segment"""
+    return tuple(
+        compass_heading(
+            WAYPOINT_LATS[i + 1] - WAYPOINT_LATS[i],
+            (WAYPOINT_LONS[i + 1] - WAYPOINT_LONS[i]) * WAYPOINT_COS_LATS[i]
+        )
+        for i in range(len(ROUTE_WAYPOINTS) - 1)
+    )
+
+def calculate_segment_lengths():
+    """Calculate the length in km of each straight route segment"""
+    return tuple(map(
+        haversine_rad,
+        WAYPOINT_LATS_RAD[:-1], WAYPOINT_LONS_RAD[:-1], WAYPOINT_COS_LATS[:-1],
+        WAYPOINT_LATS_RAD[1:], WAYPOINT_LONS_RAD[1:], WAYPOINT_COS_LATS[1:]
+    ))
+
+def calculate_cumulative_distances():
+    """Calculate distance travelled from the pickup up to each route point"""
+    segment_lengths = calculate_segment_lengths()
+    segment_starts = list(accumulate(segment_lengths, initial=0.0))
     
-    return all_points
+    # Points are evenly spaced along each straight segment, so their
+    # distances follow from the segment lengths without per-point maths
+    return [
+        segment_starts[i] + segment_lengths[i] * (k / POINTS_PER_SEGMENT)
+        for i in range(len(segment_lengths))
+        for k in range(POINTS_PER_SEGMENT + 1)
+    ]
 
 def calculate_eta(current_distance_km, speed_kmh):
     """Calculate ETA in minutes and seconds"""
@@ -114,26 +175,46 @@ def calculate_eta(current_distance_km, speed_kmh):
     seconds = int((hours * 3600) % 60)
     return minutes, seconds
 
-def generate_vitals():
-    """Generate realistic patient vitals with slight variations"""
-    import random
+def route_tick(index, cumulative_distance, speed_kmh):
+    """Calculate remaining distance, ETA and status for a route point index"""
+    last_index = len(cumulative_distance) - 1
+    remaining_distance = cumulative_distance[-1] - cumulative_distance[index]
+    eta_minutes, eta_seconds = calculate_eta(remaining_distance, speed_kmh)
     
+    if index == 0:
+        status = "pickup"
+    elif index >= last_index:
+        status = "arrived"
+    else:
+        status = "en_route"
+    
+    return remaining_distance, eta_minutes, eta_seconds, status
+
+def generate_vitals(timestamp):
+    """Generate realistic patient vitals with slight variations"""
     base_hr = 77
     base_spo2 = 95.2
     
     return {
-        "hr": base_hr + random.randint(-3, 5),
-        "spo2": round(base_spo2 + random.uniform(-1, 0.8), 1),
-        "sys": 138 + random.randint(-5, 5),
-        "dia": 88 + random.randint(-3, 3),
-        "temp": round(37.1 + random.uniform(-0.2, 0.2), 1),
-        "timestamp": datetime.now().isoformat()
+        "hr": base_hr + _randint(-3, 5),
+        "spo2": round(base_spo2 + _uniform(-1, 0.8), 1),
+        "sys": 138 + _randint(-5, 5),
+        "dia": 88 + _randint(-3, 3),
+        "temp": round(37.1 + _uniform(-0.2, 0.2), 1),
+        "timestamp": timestamp
     }
 
+def publish_batch(client, messages):
+    """Publish a tick's (topic, payload) messages back to back in one burst"""
+    for topic, payload in messages:
+        client.publish(topic, payload, qos=MQTT_QOS)
+
 def on_connect(client, userdata, flags, rc):
     """Callback when connected to MQTT broker"""
     if rc == 0:
         print("✅ Connected to MQTT broker successfully")
+        # Disable Nagle so small publishes are not held back waiting to coalesce
+        client.socket().setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
     else:
         print(f"❌ Connection failed with code {rc}")
 
@@ -144,12 +225,16 @@ def main():
     
     # Calculate route info
     total_distance = calculate_total_distance()
-    route_points = generate_route_points()
+    segment_headings = calculate_segment_headings()
+    
+    # Route is fixed, so remaining distance per point is a simple lookup
+    cumulative_distance = calculate_cumulative_distances()
+    total_points = len(cumulative_distance)
     
     print(f"📍 Route: Rani Kamlapati → AIIMS Bhopal")
     print(f"📏 Total Distance: {total_distance:.2f} km")
     print(f"🗺️  Total Waypoints: {len(ROUTE_WAYPOINTS)}")
-    print(f"📊 Interpolated Points: {len(route_points)}")
+    print(f"📊 Interpolated Points: {total_points}")
     print(f"⚡ Average Speed: {SPEED_KMH} km/h")
     print(f"⏱️  Update Interval: {UPDATE_INTERVAL}s")
     print("=" * 60)
@@ -157,6 +242,7 @@ def main():
     # Setup MQTT client
     client = mqtt.Client(client_id="ambulance_simulator")
     client.on_connect = on_connect
+    client.reconnect_delay_set(min_delay=1, max_delay=5)
     
     print(f"🔌 Connecting to MQTT broker: {BROKER}:{PORT}")
     try:
@@ -169,68 +255,49 @@ def main():
     
     print("🚀 Starting ambulance simulation...\n")
     
-    current_point_index = 0
-    total_points = len(route_points)
+    points_traveled = 0
+    remaining_distance = total_distance  # Summary stays valid if stopped before the first tick
+    
+    # Absolute deadlines keep the publish cadence from drifting with work time
+    next_tick = time.monotonic()
     
     try:
-        while current_point_index < total_points:
-            point = route_points[current_point_index]
-            
-            # Calculate remaining distance
-            remaining_distance = 0
-            for i in range(current_point_index, total_points - 1):
-                p1 = route_points[i]
-                p2 = route_points[i + 1]
-                remaining_distance += haversine_distance(
-                    p1["lat"], p1["lon"],
-                    p2["lat"], p2["lon"]
-                )
+        for current_point_index, (lat, lon, segment) in enumerate(iter_route_points()):
+            location_name = WAYPOINT_NAMES[segment]
             
-            # Calculate ETA
-            eta_minutes, eta_seconds = calculate_eta(remaining_distance, SPEED_KMH)
+            # Format the tick's timestamps once and share them across payloads
+            now = datetime.now()
+            now_iso = now.isoformat()
+            arrival = now.strftime("%H:%M")
             
-            # Status
-            if current_point_index == 0:
-                status = "pickup"
-            elif current_point_index >= total_points - 1:
-                status = "arrived"
-            else:
-                status = "en_route"
+            # Calculate remaining distance, ETA and status
+            remaining_distance, eta_minutes, eta_seconds, status = route_tick(
+                current_point_index, cumulative_distance, SPEED_KMH
+            )
             
             # Prepare location update
-            location_data = {
-                "lat": point["lat"],
-                "lon": point["lon"],
-                "speed_kmh": SPEED_KMH,
-                "heading": 180,  # Approximate heading south
-                "status": status,
-                "location_name": point["location"],
-                "timestamp": datetime.now().isoformat()
-            }
+            location_payload = LOCATION_PAYLOAD_TEMPLATE % (
+                lat, lon, segment_headings[segment], status,
+                WAYPOINT_NAMES_JSON[segment], now_iso
+            )
             
             # Prepare ETA update
-            eta_data = {
-                "eta_minutes": eta_minutes,
-                "eta_seconds": eta_seconds,
-                "remaining_km": round(remaining_distance, 2),
-                "distance": f"{remaining_distance:.2f}",
-                "eta": f"{eta_minutes}",
-                "speed": f"{SPEED_KMH}",
-                "arrival": datetime.now().strftime("%H:%M"),
-                "status": status,
-                "timestamp": datetime.now().isoformat()
-            }
+            eta_payload = ETA_PAYLOAD_TEMPLATE % (
+                eta_minutes, eta_seconds, round(remaining_distance, 2),
+                remaining_distance, eta_minutes, arrival, status, now_iso
+            )
             
-            # Publish location
-            client.publish(TOPIC_LOCATION, json.dumps(location_data))
-            
-            # Publish ETA
-            client.publish(TOPIC_ETA, json.dumps(eta_data))
-            
-            # Publish vitals every 5th update
+            # Collect the tick's location, ETA and (every 5th update) vitals
+            messages = [
+                (TOPIC_LOCATION, location_payload),
+                (TOPIC_ETA, eta_payload)
+            ]
             if current_point_index % 5 == 0:
-                vitals = generate_vitals()
-                client.publish(TOPIC_VITALS, json.dumps(vitals))
+                vitals = generate_vitals(now_iso)
+                messages.append((TOPIC_VITALS, json.dumps(vitals, separators=JSON_SEPARATORS)))
+            
+            # Publish them together so they leave in a single burst
+            publish_batch(client, messages)
             
             # Progress display
             progress = (current_point_index + 1) / total_points * 100
@@ -239,7 +306,7 @@ def main():
             bar = "█" * filled + "░" * (bar_length - filled)
             
             print(f"\r[{bar}] {progress:.1f}% | "
-                  f"📍 {point['location'][:30]:30s} | "
+                  f"📍 {location_name[:30]:30s} | "
                   f"🏥 ETA: {eta_minutes:2d}m {eta_seconds:2d}s | "
                   f"📏 {remaining_distance:.2f}km", 
                   end="", flush=True)
@@ -251,8 +318,13 @@ def main():
                 break
             
             # Move to next point
-            current_point_index += 1
-            time.sleep(UPDATE_INTERVAL)
+            points_traveled = current_point_index + 1
+            
+            # Wait for the next tick
+            next_tick += UPDATE_INTERVAL
+            sleep_for = next_tick - time.monotonic()
+            if sleep_for > 0:
+                time.sleep(sleep_for)
             
     except KeyboardInterrupt:
         print("\n\n⚠️  Simulation stopped by user")
@@ -262,7 +334,7 @@ def main():
         print("🔌 Disconnected from MQTT broker")
         print("\n" + "=" * 60)
         print("📊 Simulation Summary:")
-        print(f"   Points traveled: {current_point_index}/{total_points}")
+        print(f"   Points traveled: {points_traveled}/{total_points}")
         print(f"   Distance covered: {total_distance - remaining_distance:.2f}/{total_distance:.2f} km")
         print("=" * 60)
 
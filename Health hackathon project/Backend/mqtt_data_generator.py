@@ -16,6 +16,23 @@ import time
 import random
 import math
 import os
+import socket
+import queue
+import threading
+import heapq
+
+# Bound once so the generators skip the random module attribute lookups
+_uniform = random.uniform
+_randint = random.randint
+_choice = random.choice
+_getrandbits = random.getrandbits
+
+# Likewise for the math functions on the per-move distance path
+_sin = math.sin
+_cos = math.cos
+_asin = math.asin
+_sqrt = math.sqrt
+_radians = math.radians
 
 # ==================== MQTT CONFIGURATION ====================
 # IMPORTANT: Change this to your own MQTT broker for low latency!
@@ -45,14 +62,18 @@ TOPIC_PATIENT_VITALS = "rescue/patient/vitals"
 # ==================== DATA GENERATION SETTINGS ====================
 # Update intervals (seconds) - OPTIMIZED FOR LOW LATENCY
 VITALS_INTERVAL = 2      # Update vitals every 2 seconds (good balance)
-ECG_INTERVAL = 0.1       # Update ECG every 100ms (10 Hz - smooth waveform)
+ECG_INTERVAL = 0.1       # ECG sample spacing 100ms (10 Hz - smooth waveform)
+ECG_PUBLISH_INTERVAL = 1.0  # Publish ECG samples in 1 second batches
+ECG_SAMPLES_PER_PUBLISH = round(ECG_PUBLISH_INTERVAL / ECG_INTERVAL)
+ECG_SAMPLE_RATE_HZ = round(1 / ECG_INTERVAL)
 LOCATION_INTERVAL = 5    # Update location every 5 seconds (GPS updates)
 
 # QoS Settings - USE QoS 0 FOR LOWEST LATENCY
 # QoS 0 = At most once delivery (fire and forget, lowest latency)
 # QoS 1 = At least once delivery (acknowledged, higher latency)
 # QoS 2 = Exactly once delivery (highest latency)
-MQTT_QOS = 0  # OPTIMIZED: QoS 0 for minimal latency
+MQTT_QOS_STREAM = 0    # OPTIMIZED: QoS 0 for streaming telemetry (minimal latency)
+MQTT_QOS_RETAINED = 1  # Retained profile is sent once, so make sure it lands
 
 # Simulation parameters
 SIMULATION_MODE = "moving"  # "stationary" or "moving"
@@ -65,15 +86,45 @@ START_LON = 77.4126
 DEST_LAT = 23.2156
 DEST_LON = 77.4304
 
+# ==================== PAYLOAD TEMPLATES ====================
+# OPTIMIZED: Fixed-schema payloads are formatted straight into JSON text,
+# skipping json.dumps' dict walk and key escaping on every publish.
+# Templates are bytes so each payload is built once, ready for the socket,
+# instead of as a str that paho has to encode again.
+# Telemetry is machine-read, so it uses compact JSON with no whitespace
+JSON_SEPARATORS = (",", ":")
+VITALS_PAYLOAD_TEMPLATE = (
+    b'{"heartRate":%d,"spo2":%r,"temperature":%r,"bloodPressure":"%b",'
+    b'"respiratoryRate":%d,"timestamp":%d}'
+)
+LOCATION_PAYLOAD_TEMPLATE = (
+    b'{"lat":%r,"lon":%r,"speed":%r,"heading":%r,"accuracy":%r,"timestamp":%d}'
+)
+ETA_PAYLOAD_TEMPLATE = b'{"eta":%d,"distance":%r,"unit":"km","timestamp":%d}'
+TRAFFIC_PAYLOAD_TEMPLATE = b'{"condition":"%b","delay":%d,"timestamp":%d}'
+TRAFFIC_CONDITIONS = (b"Light", b"Moderate", b"Heavy")
+
 # ==================== MQTT CLIENT SETUP ====================
 client = mqtt.Client(client_id="rescuelink_simulator", protocol=mqtt.MQTTv311)
 
+# OPTIMIZED: Reconnect quickly after drops
+client.reconnect_delay_set(min_delay=1, max_delay=5)
+
 def on_connect(client, userdata, flags, rc):
+    global last_ecg_info
+    
     if rc == 0:
         print("✅ Connected to MQTT Broker!")
-        print(f"📡 Publishing to topics with QoS {MQTT_QOS} (LOW LATENCY MODE)")
+        
+        # Reconnecting discards paho's unsent packets, so stop waiting on them
+        last_ecg_info = None
+        
+        # OPTIMIZED: Disable Nagle so small publishes go out immediately
+        client.socket().setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        
+        print(f"📡 Publishing to topics with QoS {MQTT_QOS_STREAM} (LOW LATENCY MODE)")
         print(f"   - {TOPIC_VITALS} (every {VITALS_INTERVAL}s)")
-        print(f"   - {TOPIC_ECG} (every {ECG_INTERVAL}s)")
+        print(f"   - {TOPIC_ECG} (every {ECG_PUBLISH_INTERVAL}s, {ECG_SAMPLES_PER_PUBLISH} samples)")
         print(f"   - {TOPIC_LOCATION} (every {LOCATION_INTERVAL}s)")
         print(f"   - {TOPIC_ETA} (every {LOCATION_INTERVAL}s)")
         print(f"   - {TOPIC_TRAFFIC} (every 10s)")
@@ -92,17 +143,45 @@ def on_disconnect(client, userdata, rc):
 client.on_connect = on_connect
 client.on_disconnect = on_disconnect
 
+# ==================== PUBLISH QUEUE ====================
+# Generators only enqueue messages; a background thread hands them to the
+# MQTT client, so a slow broker never stalls data generation
+PUBLISH_QUEUE_SIZE = 1000
+publish_queue = queue.Queue(maxsize=PUBLISH_QUEUE_SIZE)
+
+def enqueue_publish(topic, payload, qos=MQTT_QOS_STREAM, retain=False):
+    """Queue a message for the publisher thread, dropping the oldest when full"""
+    message = (topic, payload, qos, retain)
+    while True:
+        try:
+            publish_queue.put_nowait(message)
+            return
+        except queue.Full:
+            # Real-time telemetry: freshness matters more than durability
+            try:
+                publish_queue.get_nowait()
+            except queue.Empty:
+                pass
+
+def publish_worker():
+    """Drain the publish queue onto the MQTT client"""
+    global last_ecg_info
+    
+    while True:
+        topic, payload, qos, retain = publish_queue.get()
+        info = client.publish(topic, payload, qos=qos, retain=retain)
+        if topic == TOPIC_ECG:
+            # A publish that failed outright (e.g. while disconnected) has
+            # nothing to wait for, and is_published() would raise on it
+            last_ecg_info = info if info.rc == mqtt.MQTT_ERR_SUCCESS else None
+
+publisher_thread = threading.Thread(target=publish_worker, name="mqtt_publisher", daemon=True)
+
 # ==================== GLOBAL STATE ====================
 current_lat = START_LAT
 current_lon = START_LON
 current_distance = 0
 ecg_time = 0
-last_vitals_time = 0
-last_ecg_time = 0
-last_location_time = 0
-last_eta_time = 0
-last_traffic_time = 0
-last_patient_vitals_time = 0
 
 # Vitals state (smooth transitions)
 current_hr = 75
@@ -112,6 +191,13 @@ current_bp_sys = 120
 current_bp_dia = 80
 current_resp = 16
 
+# Most recent vitals reading, shared by the vitals and patient vitals topics
+last_vitals = None
+last_vitals_ts = 0
+
+# Delivery handle of the newest ECG batch handed to paho (None once it is moot)
+last_ecg_info = None
+
 # ==================== PATIENT PROFILE (STATIC DATA) ====================
 def publish_patient_profile():
     """Publish patient profile once with retained flag"""
@@ -138,59 +224,66 @@ def publish_patient_profile():
         }
     }
     
-    # OPTIMIZED: Use QoS 0 with retained flag
-    client.publish(TOPIC_PATIENT_PROFILE, json.dumps(profile), qos=MQTT_QOS, retain=True)
+    # Retained one-off message: QoS 1 so late subscribers reliably get it
+    enqueue_publish(TOPIC_PATIENT_PROFILE, json.dumps(profile), qos=MQTT_QOS_RETAINED, retain=True)
     print(f"📋 Published patient profile (retained)")
 
 # ==================== VITALS GENERATION ====================
-def generate_vitals():
+# Random-walk step per unit of a byte centred on 0 (byte - 127.5 spans ±127.5)
+HR_STEP = 2 / 127.5
+SPO2_STEP = 0.5 / 127.5
+TEMP_STEP = 0.1 / 127.5
+BP_SYS_STEP = 3 / 127.5
+BP_DIA_STEP = 2 / 127.5
+RESP_STEP = 1 / 127.5
+
+def generate_vitals(ts_ms):
     """Generate realistic vital signs with smooth transitions"""
     global current_hr, current_spo2, current_temp, current_bp_sys, current_bp_dia, current_resp
     
-    # Smooth random walk for realistic changes
-    current_hr += random.uniform(-2, 2)
-    current_hr = max(60, min(100, current_hr))  # Clamp to realistic range
-    
-    current_spo2 += random.uniform(-0.5, 0.5)
-    current_spo2 = max(94, min(100, current_spo2))
-    
-    current_temp += random.uniform(-0.1, 0.1)
-    current_temp = max(97.5, min(99.5, current_temp))
-    
-    current_bp_sys += random.uniform(-3, 3)
-    current_bp_sys = max(110, min(140, current_bp_sys))
-    
-    current_bp_dia += random.uniform(-2, 2)
-    current_bp_dia = max(70, min(90, current_bp_dia))
-    
-    current_resp += random.uniform(-1, 1)
-    current_resp = max(12, min(20, current_resp))
-    
+    # Smooth random walk for realistic changes, clamped to realistic ranges
+    # OPTIMIZED: One 48-bit draw supplies a byte-sized step for each of the
+    # six vitals instead of six separate uniform() calls
+    bits = _getrandbits(48)
+    current_hr = max(60, min(100, current_hr + ((bits & 0xFF) - 127.5) * HR_STEP))
+    current_spo2 = max(94, min(100, current_spo2 + ((bits >> 8 & 0xFF) - 127.5) * SPO2_STEP))
+    current_temp = max(97.5, min(99.5, current_temp + ((bits >> 16 & 0xFF) - 127.5) * TEMP_STEP))
+    current_bp_sys = max(110, min(140, current_bp_sys + ((bits >> 24 & 0xFF) - 127.5) * BP_SYS_STEP))
+    current_bp_dia = max(70, min(90, current_bp_dia + ((bits >> 32 & 0xFF) - 127.5) * BP_DIA_STEP))
+    current_resp = max(12, min(20, current_resp + ((bits >> 40) - 127.5) * RESP_STEP))
+    
+    # OPTIMIZED: All vitals are positive, so int(x + 0.5) rounds them
+    # without the round() builtin's dispatch
     vitals = {
-        "heartRate": round(current_hr),
-        "spo2": round(current_spo2, 1),
-        "temperature": round(current_temp, 1),
-        "bloodPressure": f"{round(current_bp_sys)}/{round(current_bp_dia)}",
-        "respiratoryRate": round(current_resp),
-        "timestamp": int(time.time() * 1000)
+        "heartRate": int(current_hr + 0.5),
+        "spo2": int(current_spo2 * 10 + 0.5) / 10.0,
+        "temperature": int(current_temp * 10 + 0.5) / 10.0,
+        "bloodPressure": f"{int(current_bp_sys + 0.5)}/{int(current_bp_dia + 0.5)}",
+        "respiratoryRate": int(current_resp + 0.5),
+        "timestamp": ts_ms
     }
     
     return vitals
 
-def publish_vitals():
+def publish_vitals(ts_ms):
     """Publish vitals data with QoS 0 for lowest latency"""
-    vitals = generate_vitals()
+    global last_vitals, last_vitals_ts
+    
+    vitals = generate_vitals(ts_ms)
+    last_vitals = vitals
+    last_vitals_ts = ts_ms
+    payload = VITALS_PAYLOAD_TEMPLATE % (
+        vitals["heartRate"], vitals["spo2"], vitals["temperature"],
+        vitals["bloodPressure"].encode(), vitals["respiratoryRate"], vitals["timestamp"]
+    )
     # OPTIMIZED: QoS 0 for fire-and-forget, lowest latency
-    client.publish(TOPIC_VITALS, json.dumps(vitals), qos=MQTT_QOS)
+    enqueue_publish(TOPIC_VITALS, payload)
     print(f"📊 Vitals: HR={vitals['heartRate']} bpm, SpO2={vitals['spo2']}%, BP={vitals['bloodPressure']}, Temp={vitals['temperature']}°F, RR={vitals['respiratoryRate']}")
 
 # ==================== ECG GENERATION ====================
-def generate_ecg_point():
-    """Generate realistic ECG waveform point"""
-    global ecg_time
-    
-    # Generate PQRST complex using sine waves
-    t = ecg_time % 1.0  # Normalize to 0-1 for one heartbeat
+def ecg_waveform(t):
+    """ECG amplitude at phase t (0-1) of one heartbeat"""
+    # Generate PQRST complex using windowed Gaussians
     
     # P wave
     p_wave = 0.3 * math.exp(-((t - 0.1) ** 2) / 0.005) if 0.05 < t < 0.15 else 0
@@ -204,47 +297,100 @@ def generate_ecg_point():
     t_wave = 0.4 * math.exp(-((t - 0.6) ** 2) / 0.01) if 0.5 < t < 0.7 else 0
     
     # Combine all components
-    ecg_value = p_wave + q_wave + r_wave + s_wave + t_wave
+    return p_wave + q_wave + r_wave + s_wave + t_wave
+
+# The waveform is periodic, so sample one heartbeat into a lookup table once
+ECG_LUT_SIZE = 1024  # Power of two so the index can be masked
+ECG_LUT = tuple(ecg_waveform(i / ECG_LUT_SIZE) for i in range(ECG_LUT_SIZE))
+
+# Reused ECG batch buffer, overwritten in place before every publish
+ecg_buffer = [0.0] * ECG_SAMPLES_PER_PUBLISH
+
+def generate_ecg_samples(samples):
+    """Fill a list in place with consecutive ECG samples"""
+    global ecg_time
     
-    # Add small noise
-    ecg_value += random.uniform(-0.02, 0.02)
+    # Heart rate is fixed for the block, so the phase step is computed once
+    step = ECG_INTERVAL * (current_hr / 75.0)  # Scale with heart rate
+    phase = ecg_time % 1.0  # Normalize to 0-1 for one heartbeat
+    lut = ECG_LUT
+    lut_mask = ECG_LUT_SIZE - 1
+    uniform = _uniform
     
-    ecg_point = {
-        "value": round(ecg_value, 3),
-        "timestamp": int(time.time() * 1000)
-    }
+    # Advance the phase incrementally, wrapping once per heartbeat, and add
+    # small noise to each sample
+    for i in range(len(samples)):
+        samples[i] = round(lut[int(phase * ECG_LUT_SIZE) & lut_mask] + uniform(-0.02, 0.02), 3)
+        phase += step
+        if phase >= 1.0:
+            phase -= 1.0
     
-    ecg_time += ECG_INTERVAL * (current_hr / 75.0)  # Scale with heart rate
+    # Keeping the stored phase wrapped stops precision loss on long runs
+    ecg_time = phase
     
-    return ecg_point
+    return samples
 
-def publish_ecg():
-    """Publish ECG point with QoS 0 for lowest latency"""
-    ecg_point = generate_ecg_point()
-    # OPTIMIZED: QoS 0 for continuous waveform, lowest latency
-    client.publish(TOPIC_ECG, json.dumps(ecg_point), qos=MQTT_QOS)
+def publish_ecg(ts_ms):
+    """Publish a batch of ECG samples with QoS 0 for lowest latency"""
+    global ecg_time
+    
+    # OPTIMIZED: At QoS 0 paho queues packets internally until the socket
+    # takes them. If the previous batch still hasn't been written, the link
+    # has stalled: skip this batch instead of piling waveform behind it, but
+    # advance the phase as if it had been generated so the trace stays in time
+    info = last_ecg_info
+    if info is not None and info.rc == mqtt.MQTT_ERR_SUCCESS and not info.is_published():
+        step = ECG_INTERVAL * (current_hr / 75.0)
+        ecg_time = (ecg_time + step * ECG_SAMPLES_PER_PUBLISH) % 1.0
+        return
+    
+    dt_ms = int(ECG_INTERVAL * 1000)
+    
+    # OPTIMIZED: One message per batch amortizes MQTT framing over many samples.
+    # t0/dt_ms let consumers place every sample in time
+    ecg_batch = {
+        "samples": generate_ecg_samples(ecg_buffer),
+        "sample_rate_hz": ECG_SAMPLE_RATE_HZ,
+        "t0": ts_ms - (ECG_SAMPLES_PER_PUBLISH - 1) * dt_ms,
+        "dt_ms": dt_ms,
+        "timestamp": ts_ms
+    }
+    enqueue_publish(TOPIC_ECG, json.dumps(ecg_batch, separators=JSON_SEPARATORS))
 
 # ==================== GPS LOCATION GENERATION ====================
-def calculate_distance(lat1, lon1, lat2, lon2):
-    """Calculate distance between two GPS coordinates in km"""
+# Start and destination never move, so convert them to radians (and cos(lat)) once
+START_LAT_RAD = math.radians(START_LAT)
+START_LON_RAD = math.radians(START_LON)
+START_COS_LAT = math.cos(START_LAT_RAD)
+DEST_LAT_RAD = math.radians(DEST_LAT)
+DEST_LON_RAD = math.radians(DEST_LON)
+DEST_COS_LAT = math.cos(DEST_LAT_RAD)
+
+# km per degree for the movement step; over the ~5 km route cos(lat) barely
+# changes, so the longitude scale is taken at the start once
+KM_PER_DEG_LAT = 111.0
+KM_PER_DEG_LON = KM_PER_DEG_LAT * START_COS_LAT
+
+def distance_to_fixed_point(lat, lon, fixed_lat_rad, fixed_lon_rad, fixed_cos_lat):
+    """Calculate distance in km from a GPS coordinate to a precomputed fixed point"""
     R = 6371  # Earth's radius in km
     
-    dlat = math.radians(lat2 - lat1)
-    dlon = math.radians(lon2 - lon1)
+    lat_rad = _radians(lat)
     
-    a = math.sin(dlat/2)**2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlon/2)**2
-    c = 2 * math.asin(math.sqrt(a))
+    a = (_sin((fixed_lat_rad - lat_rad) / 2)**2 +
+         _cos(lat_rad) * fixed_cos_lat * _sin((fixed_lon_rad - _radians(lon)) / 2)**2)
+    c = 2 * _asin(min(1.0, _sqrt(a)))
     
     return R * c
 
+# Remaining distance to the hospital, refreshed only when the ambulance moves
+current_remaining = distance_to_fixed_point(START_LAT, START_LON, DEST_LAT_RAD, DEST_LON_RAD, DEST_COS_LAT)
+
 def move_towards_destination():
     """Move ambulance towards hospital"""
-    global current_lat, current_lon, current_distance
-    
-    # Calculate remaining distance
-    remaining = calculate_distance(current_lat, current_lon, DEST_LAT, DEST_LON)
+    global current_lat, current_lon, current_distance, current_remaining
     
-    if remaining < 0.05:  # Within 50 meters
+    if current_remaining < 0.05:  # Within 50 meters
         return
     
     # Move at approximately 40 km/h
@@ -256,91 +402,92 @@ def move_towards_destination():
     lon_diff = DEST_LON - current_lon
     
     # Normalize and scale
-    magnitude = math.sqrt(lat_diff**2 + lon_diff**2)
+    magnitude = math.hypot(lat_diff, lon_diff)
     if magnitude > 0:
-        current_lat += (lat_diff / magnitude) * (step_distance / 111.0)  # Roughly 111 km per degree
-        current_lon += (lon_diff / magnitude) * (step_distance / (111.0 * math.cos(math.radians(current_lat))))
+        current_lat += (lat_diff / magnitude) * (step_distance / KM_PER_DEG_LAT)  # Roughly 111 km per degree
+        current_lon += (lon_diff / magnitude) * (step_distance / KM_PER_DEG_LON)
     
     # Add small random deviation for realism
-    current_lat += random.uniform(-0.0001, 0.0001)
-    current_lon += random.uniform(-0.0001, 0.0001)
+    current_lat += _uniform(-0.0001, 0.0001)
+    current_lon += _uniform(-0.0001, 0.0001)
     
-    current_distance = calculate_distance(START_LAT, START_LON, current_lat, current_lon)
+    current_distance = distance_to_fixed_point(
+        current_lat, current_lon, START_LAT_RAD, START_LON_RAD, START_COS_LAT
+    )
+    current_remaining = distance_to_fixed_point(
+        current_lat, current_lon, DEST_LAT_RAD, DEST_LON_RAD, DEST_COS_LAT
+    )
 
-def publish_location():
+def publish_location(ts_ms):
     """Publish GPS location with QoS 0 for lowest latency"""
     global current_lat, current_lon
     
     if SIMULATION_MODE == "moving":
         move_towards_destination()
     
-    location_data = {
-        "lat": round(current_lat, 6),
-        "lon": round(current_lon, 6),
-        "speed": round(random.uniform(35, 45), 1),  # km/h
-        "heading": round(random.uniform(0, 360), 1),
-        "accuracy": round(random.uniform(5, 15), 1),  # meters
-        "timestamp": int(time.time() * 1000)
-    }
+    lat = round(current_lat, 6)
+    lon = round(current_lon, 6)
+    speed = round(_uniform(35, 45), 1)  # km/h
+    heading = round(_uniform(0, 360), 1)
+    accuracy = round(_uniform(5, 15), 1)  # meters
+    payload = LOCATION_PAYLOAD_TEMPLATE % (
+        lat, lon, speed, heading, accuracy, ts_ms
+    )
     
     # OPTIMIZED: QoS 0 for location updates
-    client.publish(TOPIC_LOCATION, json.dumps(location_data), qos=MQTT_QOS)
-    print(f"🗺️  Location: ({location_data['lat']}, {location_data['lon']}) @ {location_data['speed']} km/h")
+    enqueue_publish(TOPIC_LOCATION, payload)
+    print(f"🗺️  Location: ({lat}, {lon}) @ {speed} km/h")
 
 # ==================== ETA CALCULATION ====================
-def publish_eta():
+def publish_eta(ts_ms):
     """Publish estimated time of arrival with QoS 0"""
-    distance = calculate_distance(current_lat, current_lon, DEST_LAT, DEST_LON)
+    distance = current_remaining
     avg_speed = 40  # km/h
     
     eta_minutes = (distance / avg_speed) * 60
     eta_minutes = max(1, round(eta_minutes))  # At least 1 minute
     
-    eta_data = {
-        "eta": eta_minutes,
-        "distance": round(distance, 2),
-        "unit": "km",
-        "timestamp": int(time.time() * 1000)
-    }
+    distance = round(distance, 2)
+    payload = ETA_PAYLOAD_TEMPLATE % (eta_minutes, distance, ts_ms)
     
     # OPTIMIZED: QoS 0 for ETA updates
-    client.publish(TOPIC_ETA, json.dumps(eta_data), qos=MQTT_QOS)
-    print(f"⏱️  ETA: {eta_minutes} min ({eta_data['distance']} km)")
+    enqueue_publish(TOPIC_ETA, payload)
+    print(f"⏱️  ETA: {eta_minutes} min ({distance} km)")
 
 # ==================== TRAFFIC DATA ====================
-def publish_traffic():
+def publish_traffic(ts_ms):
     """Publish traffic conditions with QoS 0"""
-    conditions = ["Light", "Moderate", "Heavy"]
-    
-    traffic_data = {
-        "condition": random.choice(conditions),
-        "delay": random.randint(0, 5),  # minutes
-        "timestamp": int(time.time() * 1000)
-    }
+    payload = TRAFFIC_PAYLOAD_TEMPLATE % (
+        _choice(TRAFFIC_CONDITIONS),
+        _randint(0, 5),  # delay in minutes
+        ts_ms
+    )
     
     # OPTIMIZED: QoS 0 for traffic updates
-    client.publish(TOPIC_TRAFFIC, json.dumps(traffic_data), qos=MQTT_QOS)
+    enqueue_publish(TOPIC_TRAFFIC, payload)
 
 # ==================== PATIENT VITALS (Detailed) ====================
-def publish_patient_vitals():
+def publish_patient_vitals(ts_ms):
     """Publish detailed patient vitals with QoS 0"""
-    vitals = generate_vitals()
+    # Reuse the latest reading while it is fresh so both topics agree
+    if last_vitals is not None and ts_ms - last_vitals_ts < VITALS_INTERVAL * 1000:
+        vitals = last_vitals
+    else:
+        vitals = generate_vitals(ts_ms)
     
     detailed_vitals = {
         **vitals,
         "ecgRhythm": "Sinus Rhythm",
         "consciousness": "Alert",
-        "painLevel": random.randint(4, 7),
-        "timestamp": int(time.time() * 1000)
+        "painLevel": _randint(4, 7),
+        "timestamp": ts_ms
     }
     
     # OPTIMIZED: QoS 0 for vitals
-    client.publish(TOPIC_PATIENT_VITALS, json.dumps(detailed_vitals), qos=MQTT_QOS)
+    enqueue_publish(TOPIC_PATIENT_VITALS, json.dumps(detailed_vitals, separators=JSON_SEPARATORS))
 
 # ==================== MAIN LOOP ====================
 def main():
-    global last_vitals_time, last_ecg_time, last_location_time, last_eta_time, last_traffic_time, last_patient_vitals_time
-    
     print("\n🚑 RescueLink MQTT Data Simulator")
     print("=" * 50)
     print(f"📡 Connecting to MQTT broker: {MQTT_BROKER}:{MQTT_PORT}")
@@ -353,47 +500,46 @@ def main():
         return
     
     client.loop_start()
+    publisher_thread.start()
     
     print("\n🔄 Starting data generation...")
     print("⚡ OPTIMIZED FOR LOW LATENCY (QoS 0)")
     print("Press Ctrl+C to stop\n")
     
     try:
+        # Min-heap of (next_due, order, interval, publisher); order breaks ties
+        # so publishers due together still run in this sequence (location
+        # before ETA, which reads the position it just computed)
+        start_time = time.monotonic()
+        tasks = [
+            (start_time, 0, VITALS_INTERVAL, publish_vitals),
+            (start_time, 1, ECG_PUBLISH_INTERVAL, publish_ecg),
+            (start_time, 2, LOCATION_INTERVAL, publish_location),
+            (start_time, 3, LOCATION_INTERVAL, publish_eta),
+            (start_time, 4, 10, publish_traffic),          # Traffic every 10 seconds
+            (start_time, 5, 3, publish_patient_vitals),    # Patient vitals every 3 seconds
+        ]
+        heapq.heapify(tasks)
+        
         while True:
-            current_time = time.time()
-            
-            # Publish vitals every VITALS_INTERVAL seconds
-            if current_time - last_vitals_time >= VITALS_INTERVAL:
-                publish_vitals()
-                last_vitals_time = current_time
-            
-            # Publish ECG every ECG_INTERVAL seconds
-            if current_time - last_ecg_time >= ECG_INTERVAL:
-                publish_ecg()
-                last_ecg_time = current_time
-            
-            # Publish location every LOCATION_INTERVAL seconds
-            if current_time - last_location_time >= LOCATION_INTERVAL:
-                publish_location()
-                last_location_time = current_time
-            
-            # Publish ETA every LOCATION_INTERVAL seconds
-            if current_time - last_eta_time >= LOCATION_INTERVAL:
-                publish_eta()
-                last_eta_time = current_time
-            
-            # Publish traffic every 10 seconds
-            if current_time - last_traffic_time >= 10:
-                publish_traffic()
-                last_traffic_time = current_time
-            
-            # Publish patient vitals every 3 seconds
-            if current_time - last_patient_vitals_time >= 3:
-                publish_patient_vitals()
-                last_patient_vitals_time = current_time
+            # Sleep exactly until the earliest publisher is due
+            sleep_for = tasks[0][0] - time.monotonic()
+            if sleep_for > 0:
+                time.sleep(sleep_for)
             
-            # Small sleep to prevent CPU overload
-            time.sleep(0.01)
+            # One clock read per wakeup, shared by every publisher now due
+            now = time.monotonic()
+            ts_ms = int(time.time() * 1000)
+            while tasks[0][0] <= now:
+                next_due, order, interval, publisher = tasks[0]
+                publisher(ts_ms)
+                # If the loop fell behind (suspended, slow terminal), skip the
+                # missed periods rather than firing them back to back
+                next_due += interval
+                if next_due <= now:
+                    next_due = now + interval
+                # Reschedule in place: one sift instead of a pop plus a push
+                heapq.heapreplace(tasks, (next_due, order, interval, publisher))
             
     except KeyboardInterrupt:
         print("\n\n🛑 Stopping data generator...")